@@ -1,5 +1,7 @@
 import os
 import io
+import re
+import hashlib
 import tempfile
 import datetime
 import streamlit as st
@@ -7,15 +9,18 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
+import pyarrow.csv as pacsv
+
+try:
+    from numba import njit  # Optional accelerator for large uploaded files
+except ImportError:
+    njit = None
 
 # Configure Streamlit page
 st.set_page_config(page_title="Vans Interactive Dashboard", layout="wide", page_icon="🚐")
 
-# Disable PyArrow conversion to prevent conversion errors
-os.environ['STREAMLIT_DISABLE_DATAFRAME_ARROW_CONVERSION'] = '1'
-
 # Custom CSS for better styling
-st.markdown("""
+_CSS_HTML = """
 <style>
     .main > div {
         padding-top: 2rem;
@@ -36,7 +41,16 @@ st.markdown("""
         margin-bottom: 2rem;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+_HEADER_HTML = """
+<div class="dashboard-header">
+    <h1>🚐 Vans Data Interactive Dashboard</h1>
+    <p>Professional analytics for delivery operations data</p>
+</div>
+"""
+
+st.markdown(_CSS_HTML, unsafe_allow_html=True)
 
 # ---------- Authentication ----------
 PASSWORD = os.getenv("STREAMLIT_DASH_PASSWORD", "vans2025")
@@ -44,12 +58,7 @@ PASSWORD = os.getenv("STREAMLIT_DASH_PASSWORD", "vans2025")
 # Dashboard header with logout option
 col1, col2 = st.columns([4, 1])
 with col1:
-    st.markdown("""
-    <div class="dashboard-header">
-        <h1>🚐 Vans Data Interactive Dashboard</h1>
-        <p>Professional analytics for delivery operations data</p>
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(_HEADER_HTML, unsafe_allow_html=True)
 
 with col2:
     if PASSWORD and st.session_state.get('authenticated', False):
@@ -97,19 +106,47 @@ DEFAULT_CSV_PATH = "Vans_data_ultra_clean.csv"  # Use the ultra-clean CSV file
 DEFAULT_XLSX_PATH = "Vans_data_raw_new.xlsx"  # Use the corrected file
 FALLBACK_XLSX_PATH = "Vans data for dashboard.xlsx"  # Keep as fallback
 
+# Column names containing any of these are treated as numeric in uploaded files
+_NUMERIC_COL_RE = re.compile(r'age|year|egp|days|hours|deliveries|income|salary|allowance', re.I)
+
 data_choice = st.radio(
     "Choose data source:",
     ["📁 Use included sample file", "📤 Upload your own Excel file"],
     horizontal=True
 )
 
+@st.cache_data(show_spinner=False)
+def _load_csv(_source, cache_key):
+    """Parse a CSV once per file; keyed on path+mtime or on the upload's content hash"""
+    if isinstance(_source, str):
+        # Ultra-clean file: multithreaded Arrow parse straight into Arrow-backed columns;
+        # blank string cells must stay null (pandas' NA handling), not become ''
+        table = pacsv.read_csv(_source, convert_options=pacsv.ConvertOptions(strings_can_be_null=True))
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+    # Peek the header so the C parser types each column in a single pass
+    header = pd.read_csv(io.BytesIO(_source), nrows=0).columns
+    num_cols = [c for c in header if _NUMERIC_COL_RE.search(c)]
+    num_set = set(num_cols)
+    text_dtypes = {c: 'string' for c in header if c not in num_set}
+    df = pd.read_csv(io.BytesIO(_source), dtype=text_dtypes)
+    # Numeric-looking names can still hold free text ("No", "6 Years"); coerce only those
+    dirty_cols = [c for c in num_cols if not pd.api.types.is_numeric_dtype(df[c])]
+    if dirty_cols:
+        df[dirty_cols] = df[dirty_cols].apply(pd.to_numeric, errors='coerce')
+    # Typed Arrow-backed columns so Streamlit's Arrow serializer never sees mixed objects
+    df = df.convert_dtypes(dtype_backend='pyarrow')
+    return df
+
 df_all = pd.DataFrame()
+data_key = None  # Loader cache key, reused to key the derived caches below
 
 if data_choice == "📁 Use included sample file":
     # Load ultra-clean CSV (guaranteed PyArrow-safe)
     if os.path.exists(DEFAULT_CSV_PATH):
         try:
-            df_all = pd.read_csv(DEFAULT_CSV_PATH)  # Can load normally since it's ultra-clean
+            data_key = (DEFAULT_CSV_PATH, os.path.getmtime(DEFAULT_CSV_PATH))
+            df_all = _load_csv(DEFAULT_CSV_PATH, data_key)
             if not df_all.empty:
                 st.success(f"✅ Loaded ultra-clean Vans survey data: {len(df_all):,} respondents, {len(df_all.columns)} questions")
             else:
@@ -132,19 +169,10 @@ if data_choice == "📤 Upload your own Excel file" or df_all.empty:
     
     if uploaded_file is not None:
         if uploaded_file.name.endswith('.csv'):
-            df_all = pd.read_csv(uploaded_file, dtype=str)  # Force all to string initially
-            # Clean and convert numeric columns safely
-            if not df_all.empty:
-                for col in df_all.columns:
-                    df_all[col] = df_all[col].replace('nan', None)
-                numeric_indicators = ['age', 'year', 'egp', 'days', 'hours', 'deliveries', 'income', 'salary', 'allowance']
-                for col in df_all.columns:
-                    col_lower = col.lower()
-                    if any(indicator in col_lower for indicator in numeric_indicators):
-                        try:
-                            df_all[col] = pd.to_numeric(df_all[col], errors='coerce')
-                        except:
-                            pass
+            file_bytes = uploaded_file.getvalue()
+            file_hash = hashlib.blake2b(file_bytes, digest_size=8).hexdigest()
+            data_key = file_hash
+            df_all = _load_csv(file_bytes, data_key)
         else:
             st.error("Excel upload not supported in this version. Please use CSV files.")
         
@@ -154,31 +182,17 @@ if data_choice == "📤 Upload your own Excel file" or df_all.empty:
         st.info("👆 Please upload a CSV file to continue")
         st.stop()
 
+# Single guard before any pandas work: empty covers both zero rows and zero columns
 if df_all.empty:
     st.error("❌ No data available. Please upload a valid CSV file.")
     st.stop()
 
-# Ensure we have valid data
-if len(df_all) == 0 or len(df_all.columns) == 0:
-    st.error("❌ Invalid data structure. Please check your CSV file.")
-    st.stop()
-
 # Clean and prepare data
 df_all.columns = [str(c).strip() for c in df_all.columns]
 
-# Create a display-safe version for st.dataframe (all strings to avoid PyArrow issues)
-def make_display_safe(df):
-    """Convert dataframe to display-safe format (all strings) to avoid PyArrow conversion errors"""
-    display_df = df.copy()
-    for col in display_df.columns:
-        try:
-            # Convert everything to string for display, but preserve NaN as empty string
-            display_df[col] = display_df[col].astype(str).replace('nan', '').replace('<NA>', '')
-        except:
-            pass
-    return display_df
-
-df_view = df_all.copy()
+df_view = df_all  # Read-only below; alias instead of copying
+# Shape scalars reused by the KPI and summary sections
+n_rows_all, n_rows_view, n_cols = len(df_all), len(df_view), len(df_view.columns)
 
 # ---------- Key Performance Indicators ----------
 st.subheader("📈 Key Performance Indicators")
@@ -186,61 +200,85 @@ st.subheader("📈 Key Performance Indicators")
 # Create columns for KPIs
 kpi_col1, kpi_col2, kpi_col3, kpi_col4 = st.columns(4)
 
+# Below this many rows the JIT warm-up costs more than pandas' aggregation
+NUMBA_MIN_ROWS = 100_000
+
+if njit is not None:
+    # No 'nnan' fast-math flag: the kernel relies on x == x to skip NaNs
+    @njit(cache=True, fastmath={'reassoc', 'contract'})
+    def mean_count_nonnan(a):
+        """Mean and count of the non-NaN values of a float64 array in one pass"""
+        s = 0.0
+        n = 0
+        for i in range(a.shape[0]):
+            x = a[i]
+            if x == x:
+                s += x
+                n += 1
+        return (s / n if n else 0.0), n
+else:
+    mean_count_nonnan = None
+
+# Numeric KPIs - Use exact column names: (column, mean key, count key)
+NUMERIC_KPIS = [
+    ("Age (Years)", 'avg_age', 'age_count'),
+    ("Average number of deliveries per day: ______", 'avg_deliveries', 'delivery_count'),
+    ("Approximate delivery success rate (orders deliv...", 'success_rate', 'success_count'),
+    ("Please mention your Fixed Monthly Pay (if any):...", 'avg_income', 'income_count'),
+]
+COMPANY_COL = "Company"
+
 # HARDCODED KPI CALCULATIONS - Reliable and accurate
-def calculate_kpis(df):
-    """Calculate KPIs directly from known column names"""
+@st.cache_data(show_spinner=False)
+def calculate_kpis(_df, cache_key):
+    """Calculate KPIs directly from known column names; cached on the loader's key, not a frame hash"""
+    df = _df
     kpis = {}
+    cols = set(df.columns)
     
-    # Age KPI - Use exact column name
-    age_col = "Age (Years)"
-    if age_col in df.columns:
-        valid_ages = df[age_col].dropna()
-        if len(valid_ages) > 0:
-            kpis['avg_age'] = valid_ages.mean()
-            kpis['age_count'] = len(valid_ages)
-    
-    # Deliveries KPI - Use exact column name
-    delivery_col = "Average number of deliveries per day: ______"
-    if delivery_col in df.columns:
-        valid_deliveries = df[delivery_col].dropna()
-        if len(valid_deliveries) > 0:
-            kpis['avg_deliveries'] = valid_deliveries.mean()
-            kpis['delivery_count'] = len(valid_deliveries)
-    
-    # Success Rate KPI
-    success_col = "Approximate delivery success rate (orders deliv..."
-    if success_col in df.columns:
-        valid_success = df[success_col].dropna()
-        if len(valid_success) > 0:
-            kpis['success_rate'] = valid_success.mean()
-            kpis['success_count'] = len(valid_success)
-    
-    # Income KPI - Fixed pay
-    income_col = "Please mention your Fixed Monthly Pay (if any):..."
-    if income_col in df.columns:
-        valid_income = df[income_col].dropna()
-        if len(valid_income) > 0:
-            kpis['avg_income'] = valid_income.mean()
-            kpis['income_count'] = len(valid_income)
+    wanted = {col: (mean_key, count_key) for col, mean_key, count_key in NUMERIC_KPIS if col in cols}
+    for col, (mean_key, count_key) in wanted.items():
+        # Reduce over the raw float64 buffer rather than through the Series wrapper;
+        # uploaded KPI columns may still be text ("90%"), so unparseable cells become NaN
+        a = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+        if mean_count_nonnan is not None and len(a) >= NUMBA_MIN_ROWS:
+            mean, count = mean_count_nonnan(a)
+        else:
+            mask = ~np.isnan(a)
+            count = int(mask.sum())
+            mean = float(a[mask].mean()) if count else 0.0
+        if count > 0:
+            kpis[mean_key] = mean
+            kpis[count_key] = count
     
     # Company distribution
-    company_col = "Company"
-    if company_col in df.columns:
-        companies = df[company_col].dropna().nunique()
-        kpis['unique_companies'] = companies
-        kpis['top_company'] = df[company_col].mode().iloc[0] if len(df[company_col].mode()) > 0 else "N/A"
+    if COMPANY_COL in cols:
+        # One hash pass yields both the distinct count and the modal company
+        company_counts = df[COMPANY_COL].dropna().value_counts()
+        if len(company_counts) > 0:
+            # Break ties on the smallest name, as mode() did, not on order of appearance
+            kpis['top_company'] = company_counts[company_counts == company_counts.iloc[0]].index.min()
+        else:
+            kpis['top_company'] = "N/A"
+        kpis['unique_companies'] = len(company_counts)
     
     return kpis
 
+@st.cache_data(show_spinner=False)
+def total_non_null(_df, cache_key):
+    """Count answered cells from per-column non-null counts, without a full boolean mask"""
+    return int(_df.count().sum())
+
 # Calculate reliable KPIs
-kpis = calculate_kpis(df_view)
+# Keyed on the loader's cache key: Streamlit's frame hash samples rows on large frames
+kpis = calculate_kpis(df_view, data_key)
 
 # RELIABLE KPI DISPLAY - Using calculated values
 with kpi_col1:
     st.metric(
         "📊 Total Responses",
-        f"{len(df_view):,}",
-        delta=f"of {len(df_all):,} total"
+        f"{n_rows_view:,}",
+        delta=f"of {n_rows_all:,} total"
     )
 
 with kpi_col2:
@@ -267,7 +305,7 @@ with kpi_col3:
             delta=f"{kpis['income_count']} responses"
         )
     else:
-        st.metric("📊 Data Coverage", f"{len(df_view.columns)} questions")
+        st.metric("📊 Data Coverage", f"{n_cols} questions")
 
 with kpi_col4:
     if 'success_rate' in kpis:
@@ -283,7 +321,7 @@ with kpi_col4:
             delta=f"Top: {kpis['top_company']}"
         )
     else:
-        st.metric("✅ Data Quality", f"{df_view.notna().sum().sum():,} answers")
+        st.metric("✅ Data Quality", f"{total_non_null(df_view, data_key):,} answers")
 
 # ---------- Data Summary ----------
 st.subheader("📋 Data Summary")
@@ -291,18 +329,17 @@ st.subheader("📋 Data Summary")
 col1, col2 = st.columns(2)
 
 with col1:
-    st.metric("📊 Total Records", f"{len(df_view):,}")
-    st.metric("📋 Columns", len(df_view.columns))
-    if len(df_view) != len(df_all):
-        st.metric("🔍 Filtered Data", f"{(len(df_view)/len(df_all)*100):.1f}%")
+    st.metric("📊 Total Records", f"{n_rows_view:,}")
+    st.metric("📋 Columns", n_cols)
+    if n_rows_view != n_rows_all:
+        st.metric("🔍 Filtered Data", f"{(n_rows_view/n_rows_all*100):.1f}%")
     else:
         st.metric("🔍 Filtered Data", "100%")
 
 with col2:
     st.write("**Dataset Preview:**")
-    # Convert to display-safe format to avoid PyArrow issues
-    safe_df_preview = make_display_safe(df_view.head(3))
-    st.dataframe(safe_df_preview, use_container_width=True)
+    # Columns are typed and Arrow-backed, so the slice ships as-is
+    st.dataframe(df_view.head(3), use_container_width=True)
 
 # ---------- Success Message ----------
 st.success("🎉 **Mordor Intelligence Vans Delivery Dashboard** - Successfully loaded and running!")